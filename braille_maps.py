@@ -0,0 +1,146 @@
+"""
+Shared Braille mappings and deterministic encoders.
+
+The tables here are the Stage 3 ground truth used by generate_hybrid.py.
+BrailleEncoder compiles the lookup structures for any set of tables, so
+generate_data.py (Stages 1-2) builds one from its own tables.
+"""
+
+import re
+from functools import lru_cache
+
+# =============================================================================
+# GROUND TRUTH BRAILLE MAPPINGS (Deterministic - Never hallucinate)
+# =============================================================================
+
+G1_MAP = {
+    'a': '⠁', 'b': '⠃', 'c': '⠉', 'd': '⠙', 'e': '⠑',
+    'f': '⠋', 'g': '⠛', 'h': '⠓', 'i': '⠊', 'j': '⠚',
+    'k': '⠅', 'l': '⠇', 'm': '⠍', 'n': '⠝', 'o': '⠕',
+    'p': '⠏', 'q': '⠟', 'r': '⠗', 's': '⠎', 't': '⠞',
+    'u': '⠥', 'v': '⠧', 'w': '⠺', 'x': '⠭', 'y': '⠽',
+    'z': '⠵', ' ': '⠀', '.': '⠲', ',': '⠂', '!': '⠖',
+    '?': '⠦', '-': '⠤', "'": '⠄', ':': '⠒', ';': '⠆',
+    '0': '⠴', '1': '⠂', '2': '⠆', '3': '⠒', '4': '⠲',
+    '5': '⠢', '6': '⠖', '7': '⠶', '8': '⠦', '9': '⠔'
+}
+
+# Grade-2 Strong Contractions (whole words)
+G2_STRONG = {
+    'the': '⠮', 'and': '⠯', 'for': '⠿', 'of': '⠷', 'with': '⠾',
+    'child': '⠡', 'shall': '⠩', 'this': '⠹', 'which': '⠱', 'out': '⠳',
+    'still': '⠌'
+}
+
+# Grade-2 Wordsigns (single letters as words)
+G2_WORDSIGNS = {
+    'but': '⠃', 'can': '⠉', 'do': '⠙', 'every': '⠑', 'from': '⠋',
+    'go': '⠛', 'have': '⠓', 'just': '⠚', 'knowledge': '⠅', 'like': '⠇',
+    'more': '⠍', 'not': '⠝', 'people': '⠏', 'quite': '⠟', 'rather': '⠗',
+    'so': '⠎', 'that': '⠞', 'us': '⠥', 'very': '⠧', 'will': '⠺',
+    'it': '⠭', 'you': '⠽', 'as': '⠵'
+}
+
+# Grade-2 Groupsigns (within words)
+G2_GROUPSIGNS = {
+    'ing': '⠬', 'ble': '⠼', 'ch': '⠡', 'gh': '⠣', 'sh': '⠩',
+    'th': '⠹', 'wh': '⠱', 'ed': '⠫', 'er': '⠻', 'ou': '⠳',
+    'ow': '⠪', 'st': '⠌', 'ar': '⠜', 'en': '⠢', 'in': '⠔'
+}
+
+# Grade-2 Lower Wordsigns
+G2_LOWER = {
+    'be': '⠆', 'enough': '⠢', 'were': '⠶', 'his': '⠦', 'was': '⠴',
+    'to': '⠖', 'into': '⠔⠖', 'by': '⠃⠽'
+}
+
+class G1Table(dict):
+    """str.translate table built from a single-character mapping.
+
+    Characters missing from the mapping (after lower-casing, if fold_case)
+    fill in lazily with default, so arbitrary Unicode input never raises.
+    """
+    def __init__(self, mapping: dict, default: str, fold_case: bool = False):
+        super().__init__({ord(k): v for k, v in mapping.items()})
+        self.mapping = mapping
+        self.default = default
+        self.fold_case = fold_case
+
+    def __missing__(self, codepoint: int) -> str:
+        char = chr(codepoint)
+        value = self[codepoint] = self.mapping.get(char.lower() if self.fold_case else char, self.default)
+        return value
+
+# Reverse mappings for decode tasks
+G1_REVERSE = {v: k for k, v in G1_MAP.items()}
+G2_ALL = {**G2_STRONG, **G2_WORDSIGNS, **G2_LOWER}
+G2_REVERSE = {v: k for k, v in G2_ALL.items()}
+
+_G1_REVERSE_TABLE = G1Table(G1_REVERSE, ' ')
+
+class BrailleEncoder:
+    """Grade-1 / Grade-2 encoders precompiled from one set of tables.
+
+    Stage 1-2 data and Stage 3 data use different ground-truth tables, so
+    each builds its own encoder instead of sharing a single global one.
+    """
+    def __init__(self, g1_map: dict, g2_strong: dict, g2_wordsigns: dict,
+                 g2_lower: dict, g2_groupsigns: dict):
+        self._g1_table = G1Table(g1_map, '⠀', fold_case=True)
+        # Dense lookup for the ASCII fast path: indexing a tuple by code point
+        # skips the dict hashing str.translate does for a mapping table
+        self._g1_ascii_lut = tuple(g1_map.get(chr(b).lower(), '⠀') for b in range(128))
+
+        # Whole-word contractions merged for a single lookup per word; later
+        # entries win, so merge lowest priority first (strong > wordsigns > lower)
+        self._g2_wholeword = {**g2_lower, **g2_wordsigns, **g2_strong}
+
+        # Longest-first groupsigns followed by a Grade-1 character class: one
+        # regex scan per word contracts and letter-maps it in the same pass
+        self._g2_table = {**g1_map, **g2_groupsigns}
+        self._g2_re = re.compile(
+            '|'.join(map(re.escape, sorted(g2_groupsigns, key=len, reverse=True)))
+            + '|[' + ''.join(map(re.escape, g1_map)) + ']'
+        )
+        # The vocabulary is small, so repeat words are a cache hit instead of a regex scan
+        self._contract_word = lru_cache(maxsize=4096)(self._contract_word_uncached)
+
+    def _sub_g2(self, match: re.Match) -> str:
+        return self._g2_table[match.group()]
+
+    def _contract_word_uncached(self, word: str) -> str:
+        """Groupsign-contract and letter-map one word."""
+        return self._g2_re.sub(self._sub_g2, word)
+
+    def encode_g1(self, text: str) -> str:
+        """Grade-1: Pure letter-by-letter encoding."""
+        if text.isascii():
+            return text.translate(self._g1_ascii_lut)
+        return text.translate(self._g1_table)
+
+    def encode_g2(self, text: str) -> str:
+        """Grade-2: Apply contractions for compression."""
+        text = text.lower()
+        words = text.split(' ')
+        result = []
+        
+        for word in words:
+            cell = self._g2_wholeword.get(word)
+            if cell is None:
+                cell = self._contract_word(word)
+            result.append(cell)
+        
+        return '⠀'.join(result)
+
+# =============================================================================
+# DETERMINISTIC ENCODING FUNCTIONS
+# =============================================================================
+
+_ENCODER = BrailleEncoder(G1_MAP, G2_STRONG, G2_WORDSIGNS, G2_LOWER, G2_GROUPSIGNS)
+
+encode_g1 = _ENCODER.encode_g1
+encode_g2 = _ENCODER.encode_g2
+
+def decode_g1(braille: str) -> str:
+    """Grade-1: Braille to English."""
+    return braille.translate(_G1_REVERSE_TABLE)
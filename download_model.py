@@ -1,7 +1,7 @@
 """Download trained model from Modal volume."""
 
 import modal
-import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 volume = modal.Volume.from_name("braille-models")
@@ -21,10 +21,22 @@ def list_files():
     return files
 
 @app.function(volumes={"/data": volume})
-def get_file(path: str) -> bytes:
-    """Get a single file from the volume."""
+def get_file(path: str):
+    """Stream a single file from the volume in 1 MiB chunks."""
     with open(path, "rb") as f:
-        return f.read()
+        while chunk := f.read(1 << 20):
+            yield chunk
+
+def download_file(path: str, output_dir: Path) -> str:
+    """Write a streamed volume file to output_dir without holding it in memory."""
+    # Keep the layout under output/ so checkpoint-*/ files never share a local path
+    rel = path.split("/output/", 1)[1]
+    local_path = output_dir / rel
+    local_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(local_path, "wb") as out:
+        for chunk in get_file.remote_gen(path):
+            out.write(chunk)
+    return rel
 
 @app.local_entrypoint()
 def main():
@@ -42,10 +54,10 @@ def main():
     model_files = [f for f in files if "/output/" in f[0]]
     print(f"\nDownloading {len(model_files)} model files to {output_dir}/...")
     
-    for path, size in model_files:
-        filename = os.path.basename(path)
-        print(f"  Downloading {filename}...")
-        content = get_file.remote(path)
-        (output_dir / filename).write_bytes(content)
+    # Stream every file concurrently, one remote generator per file
+    paths = [path for path, _ in model_files]
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(paths)))) as pool:
+        for rel in pool.map(lambda path: download_file(path, output_dir), paths):
+            print(f"  Downloaded {rel}")
     
     print(f"\nModel downloaded to {output_dir}/")
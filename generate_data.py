@@ -1,6 +1,10 @@
 import json
 import random
 
+import numpy as np
+
+from braille_maps import BrailleEncoder
+
 # Ground Truth Grade-1 Mapping
 G1_MAP = {
     'a': '⠁', 'b': '⠃', 'c': '⠉', 'd': '⠙', 'e': '⠑', 
@@ -41,6 +45,12 @@ G2_LOWER = {
     'was': '⠴', 'to': '⠖', 'into': '⠔⠖', 'by': '⠃⠽'
 }
 
+# Stage 1-2 encoders compiled from the tables above (not the Stage 3 ones)
+_ENCODER = BrailleEncoder(G1_MAP, G2_STRONG, G2_WORDSIGNS, G2_LOWER, G2_GROUPSIGNS)
+
+to_braille_g1 = _ENCODER.encode_g1
+to_braille_g2 = _ENCODER.encode_g2
+
 # Common words for training variety
 COMMON_WORDS = [
     'the', 'and', 'for', 'with', 'that', 'have', 'this', 'will', 'from',
@@ -51,41 +61,6 @@ COMMON_WORDS = [
     'together', 'another', 'mother', 'father', 'brother', 'other'
 ]
 
-def to_braille_g1(text):
-    """Grade-1: Pure letter-by-letter translation."""
-    return "".join(G1_MAP.get(c.lower(), '⠀') for c in text)
-
-def to_braille_g2(text):
-    """Grade-2: Apply contractions for compression."""
-    text = text.lower()
-    words = text.split(' ')
-    result = []
-    
-    for word in words:
-        # Check whole word contractions first (highest priority)
-        if word in G2_STRONG:
-            result.append(G2_STRONG[word])
-        elif word in G2_WORDSIGNS:
-            result.append(G2_WORDSIGNS[word])
-        elif word in G2_LOWER:
-            result.append(G2_LOWER[word])
-        else:
-            # Apply groupsigns within the word
-            contracted = word
-            # Sort by length descending to match longest patterns first
-            for pattern, braille in sorted(G2_GROUPSIGNS.items(), key=lambda x: -len(x[0])):
-                contracted = contracted.replace(pattern, braille)
-            # Convert remaining letters with G1
-            final = ""
-            for c in contracted:
-                if c in G1_MAP:
-                    final += G1_MAP[c]
-                else:
-                    final += c  # Already a braille character from groupsign
-            result.append(final)
-    
-    return '⠀'.join(result)
-
 # Stage 1: Basic vocabulary and short sentences
 seed_phrases_g1 = [
     "hello world", "the quick brown fox", "braille is light",
@@ -118,14 +93,31 @@ seed_phrases_g2 = [
     "very still and quiet in the room"
 ]
 
+# Seed phrases are sampled thousands of times; encode each one once
+_SEED_G1_ENCODED = tuple((p, to_braille_g1(p)) for p in seed_phrases_g1)
+_SEED_G2_ENCODED = tuple((p, to_braille_g2(p)) for p in seed_phrases_g2)
+
+_ALPHABET = np.frombuffer(b"abcdefghijklmnopqrstuvwxyz ", dtype=np.uint8)
+
+def _random_strings(count, min_len=5, max_len=15):
+    """Draw `count` random lowercase strings in one vectorized gather.
+
+    Seeded from `random`, so random.seed() still makes datasets reproducible.
+    """
+    rng = np.random.default_rng(random.getrandbits(64))
+    lengths = rng.integers(min_len, max_len + 1, count).tolist()
+    chars = _ALPHABET[rng.integers(0, len(_ALPHABET), count * max_len)].tobytes().decode("ascii")
+    return [chars[i * max_len:i * max_len + n] for i, n in enumerate(lengths)]
+
 def generate_stage1_dataset(count=1000):
     dataset = []
+    fresh = iter(_random_strings(count))
     for _ in range(count):
-        phrase = random.choice(seed_phrases_g1)
+        phrase, braille = random.choice(_SEED_G1_ENCODED)
         if random.random() > 0.7:
-            phrase = "".join(random.choices("abcdefghijklmnopqrstuvwxyz ", k=random.randint(5, 15)))
+            phrase = next(fresh)
+            braille = to_braille_g1(phrase)
         
-        braille = to_braille_g1(phrase)
         dataset.append({
             "instruction": "Translate the following English text into Grade-1 Braille.",
             "input": phrase,
@@ -142,24 +134,25 @@ def generate_stage2_dataset(count=5000, g1_ratio=0.3):
     g1_ratio: proportion of Grade-1 examples to prevent catastrophic forgetting.
     """
     dataset = []
+    fresh = iter(_random_strings(count))
     
     for _ in range(count):
         if random.random() < g1_ratio:
             # Grade-1 example (prevent forgetting)
-            phrase = random.choice(seed_phrases_g1)
+            phrase, braille = random.choice(_SEED_G1_ENCODED)
             if random.random() > 0.7:
-                phrase = "".join(random.choices("abcdefghijklmnopqrstuvwxyz ", k=random.randint(5, 15)))
-            braille = to_braille_g1(phrase)
+                phrase = next(fresh)
+                braille = to_braille_g1(phrase)
             instruction = "Translate the following English text into Grade-1 Braille."
         else:
             # Grade-2 example (learn contractions)
             if random.random() > 0.5:
-                phrase = random.choice(seed_phrases_g2)
+                phrase, braille = random.choice(_SEED_G2_ENCODED)
             else:
                 # Generate random sentences from common words
                 num_words = random.randint(3, 8)
                 phrase = " ".join(random.choices(COMMON_WORDS, k=num_words))
-            braille = to_braille_g2(phrase)
+                braille = to_braille_g2(phrase)
             instruction = "Translate the following English text into Grade-2 Braille using contractions."
         
         dataset.append({
@@ -7,11 +7,19 @@ This ensures 100% accuracy on Braille output while leveraging LLM creativity.
 """
 
 import json
-import random
 import os
+import multiprocessing as mp
+import shutil
+import tempfile
+import numpy as np
+import orjson
+from functools import lru_cache
+from itertools import cycle, islice
 from pathlib import Path
 from typing import Optional
 
+from braille_maps import G2_ALL, G2_STRONG, encode_g1, encode_g2
+
 # Load environment variables
 from dotenv import load_dotenv
 load_dotenv()
@@ -30,106 +38,22 @@ except ImportError:
     print("Warning: anthropic not installed. Using synthetic-only mode.")
 
 # =============================================================================
-# GROUND TRUTH BRAILLE MAPPINGS (Deterministic - Never hallucinate)
+# COMPRESSION HELPERS
 # =============================================================================
 
-G1_MAP = {
-    'a': '⠁', 'b': '⠃', 'c': '⠉', 'd': '⠙', 'e': '⠑',
-    'f': '⠋', 'g': '⠛', 'h': '⠓', 'i': '⠊', 'j': '⠚',
-    'k': '⠅', 'l': '⠇', 'm': '⠍', 'n': '⠝', 'o': '⠕',
-    'p': '⠏', 'q': '⠟', 'r': '⠗', 's': '⠎', 't': '⠞',
-    'u': '⠥', 'v': '⠧', 'w': '⠺', 'x': '⠭', 'y': '⠽',
-    'z': '⠵', ' ': '⠀', '.': '⠲', ',': '⠂', '!': '⠖',
-    '?': '⠦', '-': '⠤', "'": '⠄', ':': '⠒', ';': '⠆',
-    '0': '⠴', '1': '⠂', '2': '⠆', '3': '⠒', '4': '⠲',
-    '5': '⠢', '6': '⠖', '7': '⠶', '8': '⠦', '9': '⠔'
-}
-
-# Grade-2 Strong Contractions (whole words)
-G2_STRONG = {
-    'the': '⠮', 'and': '⠯', 'for': '⠿', 'of': '⠷', 'with': '⠾',
-    'child': '⠡', 'shall': '⠩', 'this': '⠹', 'which': '⠱', 'out': '⠳',
-    'still': '⠌'
-}
-
-# Grade-2 Wordsigns (single letters as words)
-G2_WORDSIGNS = {
-    'but': '⠃', 'can': '⠉', 'do': '⠙', 'every': '⠑', 'from': '⠋',
-    'go': '⠛', 'have': '⠓', 'just': '⠚', 'knowledge': '⠅', 'like': '⠇',
-    'more': '⠍', 'not': '⠝', 'people': '⠏', 'quite': '⠟', 'rather': '⠗',
-    'so': '⠎', 'that': '⠞', 'us': '⠥', 'very': '⠧', 'will': '⠺',
-    'it': '⠭', 'you': '⠽', 'as': '⠵'
-}
-
-# Grade-2 Groupsigns (within words)
-G2_GROUPSIGNS = {
-    'ing': '⠬', 'ble': '⠼', 'ch': '⠡', 'gh': '⠣', 'sh': '⠩',
-    'th': '⠹', 'wh': '⠱', 'ed': '⠫', 'er': '⠻', 'ou': '⠳',
-    'ow': '⠪', 'st': '⠌', 'ar': '⠜', 'en': '⠢', 'in': '⠔'
-}
-
-# Grade-2 Lower Wordsigns
-G2_LOWER = {
-    'be': '⠆', 'enough': '⠢', 'were': '⠶', 'his': '⠦', 'was': '⠴',
-    'to': '⠖', 'into': '⠔⠖', 'by': '⠃⠽'
-}
-
-# Reverse mappings for decode tasks
-G1_REVERSE = {v: k for k, v in G1_MAP.items()}
-G2_ALL = {**G2_STRONG, **G2_WORDSIGNS, **G2_LOWER}
-G2_REVERSE = {v: k for k, v in G2_ALL.items()}
-
-# =============================================================================
-# DETERMINISTIC ENCODING FUNCTIONS
-# =============================================================================
-
-def encode_g1(text: str) -> str:
-    """Grade-1: Pure letter-by-letter encoding."""
-    return ''.join(G1_MAP.get(c.lower(), '⠀') for c in text)
-
-def decode_g1(braille: str) -> str:
-    """Grade-1: Braille to English."""
-    return ''.join(G1_REVERSE.get(c, ' ') for c in braille)
-
-def encode_g2(text: str) -> str:
-    """Grade-2: Apply contractions for compression."""
-    text = text.lower()
-    words = text.split(' ')
-    result = []
-    
-    for word in words:
-        if word in G2_STRONG:
-            result.append(G2_STRONG[word])
-        elif word in G2_WORDSIGNS:
-            result.append(G2_WORDSIGNS[word])
-        elif word in G2_LOWER:
-            result.append(G2_LOWER[word])
-        else:
-            contracted = word
-            for pattern, braille in sorted(G2_GROUPSIGNS.items(), key=lambda x: -len(x[0])):
-                contracted = contracted.replace(pattern, braille)
-            final = ""
-            for c in contracted:
-                if c in G1_MAP:
-                    final += G1_MAP[c]
-                else:
-                    final += c
-            result.append(final)
-    
-    return '⠀'.join(result)
-
+@lru_cache(maxsize=1024)
 def compress_to_n_cells(text: str, n: int) -> tuple[str, str]:
-    """Compress concept to exactly n cells using first letters."""
+    """Compress concept to exactly n cells using first letters.
+    
+    Cached: generators only ever ask for DOMAIN_CONCEPTS x 2-4 cells.
+    """
     words = text.lower().split()
-    letters = [w[0] for w in words if w and w[0].isalpha()][:n]
-    while len(letters) < n and words:
-        # Add more letters from longest word
-        longest = max(words, key=len)
-        for c in longest[1:]:
-            if c.isalpha() and len(letters) < n:
-                letters.append(c)
-    letters = letters[:n]
-    braille = ''.join(G1_MAP.get(l, '⠀') for l in letters)
+    letters = [w[0] for w in words if w[0].isalpha()][:n]
+    if len(letters) < n and words:
+        # Pad by cycling through the remaining letters of the longest word
+        fill = [c for c in max(words, key=len)[1:] if c.isalpha()]
+        letters.extend(islice(cycle(fill), n - len(letters)))
+    braille = encode_g1(''.join(letters))
     reasoning = f"Uses letters: {', '.join(letters)} from key words"
     return braille, reasoning
 
@@ -152,6 +76,10 @@ ENGLISH_PHRASES = [
     "autonomous navigation", "obstacle avoidance", "path planning algorithm"
 ]
 
+# (phrase, grade-1, grade-2, lowercase) encoded once; round-trip examples
+# sample from this instead of re-encoding the same phrases every call
+_PHRASE_CACHE = tuple((p, encode_g1(p), encode_g2(p), p.lower()) for p in ENGLISH_PHRASES)
+
 DOMAIN_CONCEPTS = [
     "emergency medical response", "blood oxygen saturation", "heart rate variability",
     "intracranial pressure", "respiratory distress syndrome", "cardiac arrhythmia",
@@ -178,18 +106,31 @@ CONTRACTION_EXPLANATIONS = {
     '⠌': "The cell ⠌ represents 'still' as a word, or 'st' within words."
 }
 
-def generate_round_trip_example() -> dict:
+# Sampling pools, built once rather than per example
+_REASONING_VARIANTS = ("explain", "combine", "infer")
+_EXPLANATION_ITEMS = tuple(CONTRACTION_EXPLANATIONS.items())
+_G2_ALL_ITEMS = tuple(G2_ALL.items())
+_G2_STRONG_ITEMS = tuple(G2_STRONG.items())
+
+def _pick(seq, u: float):
+    """Map a uniform draw in [0, 1) onto an element of seq."""
+    return seq[int(u * len(seq))]
+
+# Each generator takes three uniform draws in [0, 1) so the pipeline can
+# sample all randomness up-front in one vectorized call.
+
+def generate_round_trip_example(u0: float, u1: float, u2: float) -> dict:
     """40% of dataset: English <-> Braille translation."""
-    phrase = random.choice(ENGLISH_PHRASES)
+    phrase, g1, g2, lower = _pick(_PHRASE_CACHE, u0)
     
-    if random.random() < 0.5:
+    if u1 < 0.5:
         # English to Braille
-        if random.random() < 0.4:
+        if u2 < 0.4:
             # Grade-1
             return {
                 "instruction": "Encode the following English text to Grade-1 Braille.",
                 "input": phrase,
-                "output": encode_g1(phrase),
+                "output": g1,
                 "task_type": "g1_encode"
             }
         else:
@@ -197,23 +138,22 @@ def generate_round_trip_example() -> dict:
             return {
                 "instruction": "Encode the following English text to Grade-2 Braille using contractions.",
                 "input": phrase,
-                "output": encode_g2(phrase),
+                "output": g2,
                 "task_type": "g2_encode"
             }
     else:
         # Braille to English
-        braille = encode_g1(phrase)
         return {
             "instruction": "Decode the following Braille to English.",
-            "input": braille,
-            "output": phrase.lower(),
+            "input": g1,
+            "output": lower,
             "task_type": "decode"
         }
 
-def generate_discovery_example() -> dict:
+def generate_discovery_example(u0: float, u1: float, u2: float) -> dict:
     """25% of dataset: Propose new Grade-3+ contractions."""
-    concept = random.choice(DOMAIN_CONCEPTS)
-    n_cells = random.randint(2, 4)
+    concept = _pick(DOMAIN_CONCEPTS, u0)
+    n_cells = 2 + int(u1 * 3)
     braille, reasoning = compress_to_n_cells(concept, n_cells)
     
     templates = [
@@ -223,16 +163,16 @@ def generate_discovery_example() -> dict:
     ]
     
     return {
-        "instruction": random.choice(templates),
+        "instruction": _pick(templates, u2),
         "input": concept,
         "output": f"{braille} - {reasoning}",
         "task_type": "contraction_discovery"
     }
 
-def generate_compression_example() -> dict:
+def generate_compression_example(u0: float, u1: float, u2: float) -> dict:
     """20% of dataset: Extreme semantic compression challenges."""
-    concept = random.choice(DOMAIN_CONCEPTS)
-    n_cells = random.randint(2, 3)
+    concept = _pick(DOMAIN_CONCEPTS, u0)
+    n_cells = 2 + int(u1 * 2)
     braille, reasoning = compress_to_n_cells(concept, n_cells)
     
     return {
@@ -243,12 +183,12 @@ def generate_compression_example() -> dict:
         "metadata": {"reasoning": reasoning, "n_cells": n_cells}
     }
 
-def generate_reasoning_example() -> dict:
+def generate_reasoning_example(u0: float, u1: float, u2: float) -> dict:
     """10% of dataset: Braille logic and explanation tasks."""
-    task_variant = random.choice(["explain", "combine", "infer"])
+    task_variant = _pick(_REASONING_VARIANTS, u0)
     
     if task_variant == "explain":
-        cell, explanation = random.choice(list(CONTRACTION_EXPLANATIONS.items()))
+        cell, explanation = _pick(_EXPLANATION_ITEMS, u1)
         return {
             "instruction": f"Explain what the Braille cell {cell} represents.",
             "input": cell,
@@ -257,9 +197,12 @@ def generate_reasoning_example() -> dict:
         }
     
     elif task_variant == "combine":
-        cells = random.sample(list(G2_ALL.items()), 2)
-        word1, braille1 = cells[0]
-        word2, braille2 = cells[1]
+        # Two distinct entries: offset the second pick past the first
+        n = len(_G2_ALL_ITEMS)
+        i = int(u1 * n)
+        j = (i + 1 + int(u2 * (n - 1))) % n
+        word1, braille1 = _G2_ALL_ITEMS[i]
+        word2, braille2 = _G2_ALL_ITEMS[j]
         combined = braille1 + braille2
         meaning = f"{word1} {word2}"
         return {
@@ -270,8 +213,7 @@ def generate_reasoning_example() -> dict:
         }
     
     else:  # infer
-        word = random.choice(list(G2_STRONG.keys()))
-        braille = G2_STRONG[word]
+        word, braille = _pick(_G2_STRONG_ITEMS, u1)
         return {
             "instruction": "Identify the English word represented by this Grade-2 contraction.",
             "input": braille,
@@ -279,7 +221,7 @@ def generate_reasoning_example() -> dict:
             "task_type": "braille_reasoning"
         }
 
-def generate_swarm_example() -> dict:
+def generate_swarm_example(u0: float, u1: float, u2: float) -> dict:
     """5% of dataset: Multi-agent negotiation protocols."""
     scenarios = [
         {
@@ -307,7 +249,7 @@ def generate_swarm_example() -> dict:
             "task_type": "swarm_negotiation"
         }
     ]
-    return random.choice(scenarios)
+    return _pick(scenarios, u0)
 
 # =============================================================================
 # MAIN GENERATION PIPELINE
@@ -321,9 +263,54 @@ TASK_DISTRIBUTION = {
     "swarm": (0.05, generate_swarm_example)
 }
 
-def generate_stage3_dataset(n_examples: int = 50000, output_path: str = "stage3_instruction_tuning.jsonl"):
-    """Generate Stage 3 dataset with task distribution."""
-    dataset = []
+# Generators indexed by task id (position in TASK_DISTRIBUTION)
+_GENERATORS = tuple(generator for _, generator in TASK_DISTRIBUTION.values())
+
+def _dumps_line(example: dict) -> bytes:
+    """Serialize one example as a UTF-8 JSONL line."""
+    return orjson.dumps(example, option=orjson.OPT_APPEND_NEWLINE)
+
+def _generate_chunk(job: tuple[str, list[int], list[list[float]]]) -> str:
+    """Worker: write one chunk of task ids and their draws to its own shard file."""
+    shard_path, task_ids, draws = job
+    with open(shard_path, "wb", buffering=1 << 20) as f:
+        for task_id, u in zip(task_ids, draws):
+            f.write(_dumps_line(_GENERATORS[task_id](*u)))
+    return shard_path
+
+def _concat_shards(shard_paths: list[str], output_path: str):
+    """Concatenate shards in order, zero-copy via os.sendfile where supported."""
+    use_sendfile = True
+    with open(output_path, "wb") as dst:
+        for path in shard_paths:
+            with open(path, "rb") as src:
+                size = os.fstat(src.fileno()).st_size
+                offset = 0
+                if use_sendfile:
+                    try:
+                        while offset < size:
+                            offset += os.sendfile(dst.fileno(), src.fileno(), offset, size - offset)
+                    except (AttributeError, OSError):
+                        # No file-to-file sendfile on this platform (e.g. macOS). Stay
+                        # on buffered writes from here on: a later raw-fd sendfile
+                        # would overtake bytes still sitting in dst's buffer
+                        use_sendfile = False
+                if not use_sendfile:
+                    src.seek(offset)
+                    shutil.copyfileobj(src, dst)
+
+def generate_stage3_dataset(n_examples: int = 50000, output_path: str = "stage3_instruction_tuning.jsonl",
+                            seed: Optional[int] = None, workers: Optional[int] = None,
+                            chunk_size: int = 2000):
+    """Generate Stage 3 dataset with task distribution.
+    
+    Examples are independent, so chunks are generated across `workers`
+    processes (default: all cores). All randomness is drawn here up-front,
+    so a given seed yields the same file regardless of worker count.
+    """
+    # Draw every example's randomness in one vectorized call
+    rng = np.random.default_rng(seed)
+    draws = rng.random((n_examples, 3)).tolist()
     
     # Calculate examples per task
     task_counts = {task: int(n_examples * weight) for task, (weight, _) in TASK_DISTRIBUTION.items()}
@@ -337,30 +324,36 @@ def generate_stage3_dataset(n_examples: int = 50000, output_path: str = "stage3_
     for task, count in task_counts.items():
         print(f"  {task}: {count} ({count/n_examples*100:.1f}%)")
     
-    # Generate examples
-    for task, count in task_counts.items():
-        _, generator = TASK_DISTRIBUTION[task]
-        for i in range(count):
-            example = generator()
-            dataset.append(example)
-            
-            if (i + 1) % 1000 == 0:
-                print(f"  {task}: {i+1}/{count}")
+    # Flat plan of task ids, one per output line; shuffling the plan rather
+    # than the finished examples means nothing has to be held in memory
+    plan = np.repeat(np.arange(len(_GENERATORS), dtype=np.int8), list(task_counts.values()))
+    rng.shuffle(plan)
     
-    # Shuffle
-    random.shuffle(dataset)
+    # Generate in parallel, one shard file per chunk, then stitch the shards
+    # together in chunk order so output is deterministic
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as shard_dir:
+        jobs = (
+            (os.path.join(shard_dir, f"shard_{k:05d}.jsonl"),
+             plan[start:start + chunk_size].tolist(), draws[start:start + chunk_size])
+            for k, start in enumerate(range(0, n_examples, chunk_size))
+        )
+        shard_paths = []
+        with mp.Pool(workers or os.cpu_count()) as pool:
+            for shard_path in pool.imap(_generate_chunk, jobs):
+                shard_paths.append(shard_path)
+                print(f"  {min(len(shard_paths) * chunk_size, n_examples)}/{n_examples}")
+        
+        _concat_shards(shard_paths, output_path)
     
-    # Save
-    with open(output_path, "w", encoding="utf-8") as f:
-        for entry in dataset:
-            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    with open(output_path, encoding="utf-8") as f:
+        samples = [json.loads(line) for line, _ in zip(f, range(5))]
     
     print(f"\nDataset saved to {output_path}")
-    print(f"Total examples: {len(dataset)}")
+    print(f"Total examples: {n_examples}")
     
-    # Print sample
+    # Print sample (order is already shuffled)
     print("\nSample examples:")
-    for i, ex in enumerate(random.sample(dataset, min(5, len(dataset)))):
+    for i, ex in enumerate(samples):
         print(f"\n--- Example {i+1} ({ex.get('task_type', 'unknown')}) ---")
         print(f"Instruction: {ex['instruction']}")
         print(f"Input: {ex['input'][:50]}..." if len(ex.get('input', '')) > 50 else f"Input: {ex.get('input', '')}")
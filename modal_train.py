@@ -9,14 +9,26 @@ from pathlib import Path
 LOCAL_DIR = Path("/home/owner/CascadeProjects/braille")
 
 # Define the image with all dependencies
-image = modal.Image.debian_slim(python_version="3.11").pip_install(
-    "torch",
-    "transformers",
-    "accelerate",
-    "datasets",
-    "tokenizers",
+# CUDA devel base so flash-attn can build against the toolkit; it needs torch
+# installed first, hence the separate layer without build isolation
+image = (
+    modal.Image.from_registry("nvidia/cuda:12.4.1-cudnn-devel-ubuntu22.04", add_python="3.11")
+    .pip_install(
+        "torch==2.4.*",
+        "transformers",
+        "accelerate",
+        "datasets",
+        "tokenizers",
+        "ninja",
+        "packaging",
+        "wheel",
+    )
+    .pip_install("flash-attn==2.6.*", extra_options="--no-build-isolation")
 )
 
+# Lightweight image for volume bookkeeping that doesn't need the training stack
+util_image = modal.Image.debian_slim(python_version="3.11")
+
 app = modal.App("braille-native-training")
 
 # Volume to persist trained model and upload data
@@ -29,73 +41,98 @@ def upload_files():
     os.makedirs("/data/braille", exist_ok=True)
     return "Ready for upload"
 
+def file_sha256(path) -> str:
+    """SHA-256 of a file, read in 64 MB chunks so large shards never sit in memory."""
+    import hashlib
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+@app.function(image=util_image, volumes={"/data": volume})
+def volume_file_hashes(remote_dir: str, rel_paths: list) -> dict:
+    """SHA-256 of the given files under /data/<remote_dir> that already exist, keyed by relative path."""
+    import os
+    root = f"/data/{remote_dir}"
+    hashes = {}
+    for rel in rel_paths:
+        path = os.path.join(root, rel)
+        if os.path.isfile(path):
+            hashes[rel] = file_sha256(path)
+    return hashes
+
 @app.function(
     image=image,
     gpu="A100",  # or "A10G" for cheaper, "H100" for fastest
+    cpu=8,  # cores for the dataloader workers
     timeout=7200,  # 2 hours max
     volumes={"/data": volume},
 )
-def train_stage3(model_files: dict, dataset_content: str):
+def train_stage3():
     import os
-    import json
     import torch
-    from transformers import AutoModelForCausalLM, AutoTokenizer, TrainingArguments, Trainer
-    from datasets import Dataset
+    from transformers import AutoModelForCausalLM, AutoTokenizer, TrainingArguments, Trainer, DataCollatorForSeq2Seq
+    from datasets import load_dataset
     
     work_dir = "/data/braille"
     os.makedirs(work_dir, exist_ok=True)
     os.chdir(work_dir)
     
-    # Write model files
+    # Model files and dataset are uploaded to the volume by the local entrypoint
     model_dir = f"{work_dir}/model"
-    os.makedirs(model_dir, exist_ok=True)
-    for filename, content in model_files.items():
-        filepath = f"{model_dir}/{filename}"
-        if isinstance(content, bytes):
-            with open(filepath, "wb") as f:
-                f.write(content)
-        else:
-            with open(filepath, "w") as f:
-                f.write(content)
-    
-    # Write dataset
     data_path = f"{work_dir}/dataset.jsonl"
-    with open(data_path, "w") as f:
-        f.write(dataset_content)
     
     output_dir = f"{work_dir}/output"
     
     print(f"Loading model from {model_dir}")
-    model = AutoModelForCausalLM.from_pretrained(model_dir, torch_dtype=torch.bfloat16, device_map="auto")
+    model = AutoModelForCausalLM.from_pretrained(
+        model_dir,
+        torch_dtype=torch.bfloat16,
+        attn_implementation="flash_attention_2",
+        device_map="auto",
+    )
     tokenizer = AutoTokenizer.from_pretrained(model_dir)
     
     if tokenizer.pad_token is None:
         tokenizer.pad_token = tokenizer.eos_token
     
     print(f"Loading dataset from {data_path}")
-    # Load JSONL manually
-    data = []
-    with open(data_path, "r") as f:
-        for line in f:
-            data.append(json.loads(line))
-    dataset = Dataset.from_list(data)
+    # Arrow's JSON reader parses natively and memory-maps the result
+    dataset = load_dataset("json", data_files=data_path, split="train", keep_in_memory=False)
     
-    def tokenize_fn(examples):
-        texts = []
-        for inst, inp, out in zip(examples["instruction"], examples["input"], examples["output"]):
-            if inp:
-                texts.append(f"{inst}\n{inp}\n{out}")
-            else:
-                texts.append(f"{inst}\n{out}")
-        return tokenizer(texts, truncation=True, max_length=256, padding="max_length")
+    max_length = 256
+    newline_ids = tokenizer.encode("\n", add_special_tokens=False)
     
-    tokenized_dataset = dataset.map(tokenize_fn, batched=True, remove_columns=dataset.column_names)
+    def tokenize_fn(examples):
+        # One batched tokenizer call per column, spliced with newline ids
+        inst_ids = tokenizer(examples["instruction"], add_special_tokens=False)["input_ids"]
+        inp_ids = tokenizer(examples["input"], add_special_tokens=False)["input_ids"]
+        out_ids = tokenizer(examples["output"], add_special_tokens=False)["input_ids"]
+        input_ids, labels = [], []
+        for inp, inst_tok, inp_tok, out_tok in zip(examples["input"], inst_ids, inp_ids, out_ids):
+            prompt = inst_tok + newline_ids + (inp_tok + newline_ids if inp else [])
+            # [EOS] after the output teaches the model where its answer ends
+            out_tok = out_tok + [tokenizer.eos_token_id]
+            input_ids.append((prompt + out_tok)[:max_length])
+            # Loss only on the output; prompt tokens are masked with -100
+            labels.append(([-100] * len(prompt) + out_tok)[:max_length])
+        attention_mask = [[1] * len(ids) for ids in input_ids]
+        return {"input_ids": input_ids, "attention_mask": attention_mask, "labels": labels}
+    
+    tokenized_dataset = dataset.map(
+        tokenize_fn,
+        batched=True,
+        batch_size=1000,
+        num_proc=max(1, (os.cpu_count() or 2) // 2),
+        remove_columns=dataset.column_names,
+    )
     
-    def add_labels(examples):
-        examples["labels"] = examples["input_ids"].copy()
-        return examples
+    # Pad per batch (to a multiple of 8 for Tensor Cores); prompt-masked labels are padded with -100
+    collator = DataCollatorForSeq2Seq(tokenizer, pad_to_multiple_of=8)
     
-    tokenized_dataset = tokenized_dataset.map(add_labels, batched=True)
+    # KV cache is useless during training and conflicts with gradient checkpointing
+    model.config.use_cache = False
     
     training_args = TrainingArguments(
         output_dir=output_dir,
@@ -109,6 +146,14 @@ def train_stage3(model_files: dict, dataset_content: str):
         save_steps=500,
         save_total_limit=2,
         bf16=True,  # A100 supports bf16
+        tf32=True,
+        gradient_checkpointing=True,
+        gradient_checkpointing_kwargs={"use_reentrant": False},
+        optim="adamw_torch_fused",
+        torch_compile=True,
+        dataloader_pin_memory=True,
+        dataloader_num_workers=4,
+        dataloader_persistent_workers=True,
         report_to="none",
     )
     
@@ -116,6 +161,7 @@ def train_stage3(model_files: dict, dataset_content: str):
         model=model,
         args=training_args,
         train_dataset=tokenized_dataset,
+        data_collator=collator,
     )
     
     print("Starting training...")
@@ -133,26 +179,27 @@ def train_stage3(model_files: dict, dataset_content: str):
 def main():
     import os
     
-    print("Loading local files...")
+    print("Syncing local files to volume...")
     
-    # Load model files
+    # Local file -> path under /data/braille on the volume
     model_dir = LOCAL_DIR / "braille-trained-g2"
-    model_files = {}
-    for f in model_dir.iterdir():
-        if f.is_file():
-            print(f"  Loading {f.name}...")
-            if f.suffix in [".safetensors", ".bin"]:
-                model_files[f.name] = f.read_bytes()
-            else:
-                model_files[f.name] = f.read_text()
-    
-    # Load dataset
     dataset_path = LOCAL_DIR / "stage3_instruction_tuning.jsonl"
-    print(f"  Loading dataset ({dataset_path.stat().st_size / 1024 / 1024:.1f} MB)...")
-    dataset_content = dataset_path.read_text()
-    
-    print(f"\nUploading {len(model_files)} model files + dataset to Modal...")
-    print("Starting Stage 3 training on Modal A100...")
-    
-    result = train_stage3.remote(model_files, dataset_content)
+    files = {f: f"model/{f.name}" for f in model_dir.iterdir() if f.is_file()}
+    files[dataset_path] = "dataset.jsonl"
+    
+    # Files are streamed from disk by the upload; anything whose hash already
+    # matches the volume copy from a previous run is skipped
+    remote_hashes = volume_file_hashes.remote("braille", list(files.values()))
+    with volume.batch_upload(force=True) as batch:
+        for local_path, remote_path in files.items():
+            size_mb = local_path.stat().st_size / 1024 / 1024
+            if remote_hashes.get(remote_path) == file_sha256(local_path):
+                print(f"  {remote_path} unchanged, skipping")
+                continue
+            print(f"  Uploading {remote_path} ({size_mb:.1f} MB)...")
+            batch.put_file(str(local_path), f"/braille/{remote_path}")
+    
+    print("\nStarting Stage 3 training on Modal A100...")
+    
+    result = train_stage3.remote()
     print(result)
@@ -1,13 +1,17 @@
+import os
+import json
+import hashlib
+from pathlib import Path
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer, TrainingArguments, Trainer
-from datasets import load_dataset
+from transformers import AutoModelForCausalLM, AutoTokenizer, TrainingArguments, Trainer, DataCollatorForSeq2Seq
+from datasets import load_dataset, load_from_disk
 
 def format_example(example, tokenizer):
     """Format instruction/input/output into a single Braille-native sequence."""
     # For now, we train on pure Braille output sequences
     # The model learns to predict Braille tokens autoregressively
     text = example["output"]
-    return tokenizer(text, truncation=True, max_length=128, padding="max_length")
+    return tokenizer(text, truncation=True, max_length=128)
 
 def format_instruction_example(example, tokenizer):
     """Format full instruction+input+output for instruction tuning."""
@@ -22,7 +26,20 @@ def format_instruction_example(example, tokenizer):
     else:
         full_text = f"{instruction}\n{output}"
     
-    return tokenizer(full_text, truncation=True, max_length=256, padding="max_length")
+    return tokenizer(full_text, truncation=True, max_length=256)
+
+# Bump when tokenize_fn's output changes so stale caches are not reused
+TOKENIZED_CACHE_VERSION = 4
+
+def tokenized_cache_dir(data_path, tokenizer, max_length, instruction_format):
+    """Cache location keyed on the raw JSONL, tokenizer vocab and tokenization settings."""
+    h = hashlib.sha1()
+    with open(data_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    h.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode())
+    h.update(f"{TOKENIZED_CACHE_VERSION}:{type(tokenizer).__name__}:{max_length}:{instruction_format}".encode())
+    return Path(data_path).parent / ".cache" / f"tokenized-{h.hexdigest()[:16]}"
 
 def main():
     import sys
@@ -55,33 +72,68 @@ def main():
     if tokenizer.pad_token is None:
         tokenizer.pad_token = tokenizer.eos_token
     
-    # Load dataset
-    dataset = load_dataset("json", data_files=data_path, split="train")
+    max_length = 256 if use_instruction_format else 128
     
     # Tokenize
     if use_instruction_format:
         # Stage 3: Full instruction tuning format
+        newline_ids = tokenizer.encode("\n", add_special_tokens=False)
+        
         def tokenize_fn(examples):
-            texts = []
-            for inst, inp, out in zip(examples["instruction"], examples["input"], examples["output"]):
-                if inp:
-                    texts.append(f"{inst}\n{inp}\n{out}")
-                else:
-                    texts.append(f"{inst}\n{out}")
-            return tokenizer(texts, truncation=True, max_length=256, padding="max_length")
+            # One batched tokenizer call per column, spliced with newline ids
+            inst_ids = tokenizer(examples["instruction"], add_special_tokens=False)["input_ids"]
+            inp_ids = tokenizer(examples["input"], add_special_tokens=False)["input_ids"]
+            out_ids = tokenizer(examples["output"], add_special_tokens=False)["input_ids"]
+            input_ids, labels = [], []
+            for inp, inst_tok, inp_tok, out_tok in zip(examples["input"], inst_ids, inp_ids, out_ids):
+                prompt = inst_tok + newline_ids + (inp_tok + newline_ids if inp else [])
+                # [EOS] after the output teaches the model where its answer ends
+                out_tok = out_tok + [tokenizer.eos_token_id]
+                input_ids.append((prompt + out_tok)[:max_length])
+                # Loss only on the output; prompt tokens are masked with -100
+                labels.append(([-100] * len(prompt) + out_tok)[:max_length])
+            attention_mask = [[1] * len(ids) for ids in input_ids]
+            return {"input_ids": input_ids, "attention_mask": attention_mask, "labels": labels}
     else:
         # Stage 1-2: Output only
         def tokenize_fn(examples):
-            return tokenizer(examples["output"], truncation=True, max_length=128, padding="max_length")
+            # Leave room for [EOS] so the model learns where a sequence ends
+            enc = tokenizer(examples["output"], truncation=True, max_length=max_length - 1)
+            input_ids = [ids + [tokenizer.eos_token_id] for ids in enc["input_ids"]]
+            attention_mask = [[1] * len(ids) for ids in input_ids]
+            # Explicit labels so [EOS] is trained even if it doubles as the pad token
+            labels = [list(ids) for ids in input_ids]
+            return {"input_ids": input_ids, "attention_mask": attention_mask, "labels": labels}
+    
+    # Reuse the tokenized dataset from an earlier run on identical data/settings
+    cache_dir = tokenized_cache_dir(data_path, tokenizer, max_length, use_instruction_format)
+    if cache_dir.exists():
+        print(f"Loading tokenized dataset from {cache_dir}")
+        tokenized_dataset = load_from_disk(str(cache_dir))
+    else:
+        dataset = load_dataset("json", data_files=data_path, split="train")
+        tokenized_dataset = dataset.map(
+            tokenize_fn,
+            batched=True,
+            batch_size=1000,
+            num_proc=max(1, (os.cpu_count() or 2) // 2),
+            remove_columns=dataset.column_names,
+        )
+        # Write then rename so an interrupted save is never picked up as a cache hit
+        tmp_dir = cache_dir.with_name(cache_dir.name + ".tmp")
+        tokenized_dataset.save_to_disk(str(tmp_dir))
+        tmp_dir.rename(cache_dir)
     
-    tokenized_dataset = dataset.map(tokenize_fn, batched=True, remove_columns=dataset.column_names)
+    # Pad per batch (to a multiple of 8 for Tensor Cores); labels come from
+    # tokenize_fn and are padded with -100
+    collator = DataCollatorForSeq2Seq(tokenizer, pad_to_multiple_of=8)
     
-    # Add labels for causal LM (labels = input_ids)
-    def add_labels(examples):
-        examples["labels"] = examples["input_ids"].copy()
-        return examples
+    # Mixed precision / fused kernels only where the hardware supports them
+    use_cuda = torch.cuda.is_available()
+    use_bf16 = use_cuda and torch.cuda.is_bf16_supported()
     
-    tokenized_dataset = tokenized_dataset.map(add_labels, batched=True)
+    # KV cache is useless during training and conflicts with gradient checkpointing
+    model.config.use_cache = False
     
     # Training arguments
     training_args = TrainingArguments(
@@ -95,8 +147,16 @@ def main():
         logging_steps=50,
         save_steps=500,
         save_total_limit=2,
-        bf16=False,
+        bf16=use_bf16,
         fp16=False,
+        tf32=use_bf16,  # Ampere+ (same hardware as bf16)
+        gradient_checkpointing=True,
+        gradient_checkpointing_kwargs={"use_reentrant": False},
+        optim="adamw_torch_fused" if use_cuda else "adamw_torch",
+        torch_compile=use_cuda,
+        dataloader_pin_memory=use_cuda,
+        dataloader_num_workers=4,
+        dataloader_persistent_workers=True,
         report_to="none",
     )
     
@@ -105,6 +165,7 @@ def main():
         model=model,
         args=training_args,
         train_dataset=tokenized_dataset,
+        data_collator=collator,
     )
     
     # Train
@@ -3,10 +3,14 @@ Validation Probe Suite for Braille-Native LLM
 Tests the 6 probes from BUILDER_PROMPT.md + additional metrics.
 """
 
+import numpy as np
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer, StoppingCriteria, StoppingCriteriaList
 import json
 from pathlib import Path
+from typing import Optional
+
+from braille_maps import G1Table
 
 # Ground truth mappings for validation
 G1_MAP = {
@@ -24,56 +28,136 @@ G2_STRONG = {
 
 G1_REVERSE = {v: k for k, v in G1_MAP.items()}
 
+_G1_TABLE = G1Table(G1_MAP, '⠀', fold_case=True)
+_G1_REVERSE_TABLE = G1Table(G1_REVERSE, ' ')
+
 def encode_g1(text):
-    return ''.join(G1_MAP.get(c.lower(), '⠀') for c in text)
+    return text.translate(_G1_TABLE)
 
 def decode_g1(braille):
-    return ''.join(G1_REVERSE.get(c, ' ') for c in braille)
+    return braille.translate(_G1_REVERSE_TABLE)
 
-class BrailleValidator:
-    def __init__(self, model_path: str):
-        print(f"Loading model from {model_path}...")
-        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
-        self.model = AutoModelForCausalLM.from_pretrained(
-            model_path, 
-            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-            device_map="auto" if torch.cuda.is_available() else None
+def _model_dtype() -> torch.dtype:
+    """Half precision on GPU (bf16 where the hardware has it), fp32 on CPU."""
+    if not torch.cuda.is_available():
+        return torch.float32
+    return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+
+class StopOnTokens(StoppingCriteria):
+    """Per-sequence stop once the last generated token is one of token_ids."""
+    def __init__(self, token_ids):
+        self.token_ids = torch.tensor(sorted(token_ids))
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.isin(input_ids[:, -1], self.token_ids.to(input_ids.device))
+
+class StopOnSubstring(StoppingCriteria):
+    """Per-sequence stop once row i's generated text contains needles[i]."""
+    def __init__(self, tokenizer, needles, prompt_len):
+        self.tokenizer = tokenizer
+        self.needles = needles
+        self.prompt_len = prompt_len
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        generated = self.tokenizer.batch_decode(input_ids[:, self.prompt_len:], skip_special_tokens=True)
+        return torch.tensor([n in g for n, g in zip(self.needles, generated)], device=input_ids.device)
+
+def _newline_stop(tokenizer):
+    """Stop at a newline for single-line answers, if the tokenizer has a real newline token."""
+    ids = tokenizer.encode("\n", add_special_tokens=False)
+    if len(ids) != 1 or ids[0] == tokenizer.unk_token_id:
+        return None
+    return StoppingCriteriaList([StopOnTokens(ids)])
+
+def _generate_batch(model, tokenizer, prompts: list[str], max_new_tokens: int = 64,
+                    stopping_criteria=None, stop_needles=None) -> list[str]:
+    """Greedy-decode all prompts in one padded generate() call; returns only the new text.
+
+    If stop_needles is given, row i stops as soon as its new text contains stop_needles[i].
+    """
+    # Decoder-only models continue from the last position, so pad on the left
+    tokenizer.padding_side = "left"
+    inputs = tokenizer(prompts, return_tensors="pt", padding=True)
+    # Remove token_type_ids if present (not used by this model)
+    inputs = {k: v for k, v in inputs.items() if k != "token_type_ids"}
+    if torch.cuda.is_available():
+        inputs = {k: v.cuda() for k, v in inputs.items()}
+    prompt_len = inputs["input_ids"].shape[1]
+    
+    if stop_needles is not None:
+        stopping_criteria = StoppingCriteriaList(
+            [*(stopping_criteria or []), StopOnSubstring(tokenizer, stop_needles, prompt_len)]
         )
-        self.model.eval()
-        print("Model loaded.")
+    
+    # inference_mode also skips autograd version-counter bookkeeping
+    with torch.inference_mode(), torch.autocast("cuda", dtype=_model_dtype(), enabled=torch.cuda.is_available()):
+        outputs = model.generate(
+            **inputs,
+            max_new_tokens=max_new_tokens,
+            do_sample=False,
+            num_beams=1,
+            # Finished sequences stop decoding instead of running to max_new_tokens
+            eos_token_id=tokenizer.eos_token_id,
+            pad_token_id=tokenizer.pad_token_id,
+            stopping_criteria=stopping_criteria,
+        )
+    
+    # Keep just the generated part (after the padded prompt)
+    new_tokens = outputs[:, prompt_len:]
+    return [text.strip() for text in tokenizer.batch_decode(new_tokens, skip_special_tokens=True)]
+
+def load_model(model_path: str):
+    """Load the model and tokenizer once; weights stream straight to their device."""
+    print(f"Loading model from {model_path}...")
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForCausalLM.from_pretrained(
+        model_path, 
+        torch_dtype=_model_dtype(),
+        attn_implementation="sdpa",
+        low_cpu_mem_usage=True,
+        device_map="auto" if torch.cuda.is_available() else None
+    )
+    model.generation_config.use_cache = True
+    model.eval()
+    print("Model loaded.")
+    return model, tokenizer
+
+class BrailleValidator:
+    def __init__(self, model_path: Optional[str] = None, model=None, tokenizer=None):
+        # Reuse an already-loaded model when given, otherwise load from model_path
+        if model is None or tokenizer is None:
+            if model_path is None:
+                raise ValueError("BrailleValidator needs either model_path or both model and tokenizer")
+            model, tokenizer = load_model(model_path)
+        self.model = model
+        self.tokenizer = tokenizer
     
     def generate(self, prompt: str, max_new_tokens: int = 64) -> str:
         """Generate response from the model."""
-        inputs = self.tokenizer(prompt, return_tensors="pt")
-        # Remove token_type_ids if present (not used by this model)
-        inputs = {k: v for k, v in inputs.items() if k != "token_type_ids"}
-        if torch.cuda.is_available():
-            inputs = {k: v.cuda() for k, v in inputs.items()}
-        
-        with torch.no_grad():
-            outputs = self.model.generate(
-                **inputs,
-                max_new_tokens=max_new_tokens,
-                do_sample=False,
-                pad_token_id=self.tokenizer.pad_token_id,
-            )
-        
-        response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        # Extract just the generated part (after the prompt)
-        if response.startswith(prompt):
-            response = response[len(prompt):].strip()
-        return response
+        return self.generate_batch([prompt], max_new_tokens)[0]
+    
+    def generate_batch(self, prompts: list[str], max_new_tokens: int = 64,
+                       stopping_criteria=None, stop_needles=None) -> list[str]:
+        """Generate responses for several prompts in a single batched call."""
+        return _generate_batch(self.model, self.tokenizer, prompts, max_new_tokens, stopping_criteria, stop_needles)
     
     def probe_g1_roundtrip(self, test_cases: list[str]) -> dict:
         """Probe 1: Grade-1 round-trip accuracy."""
         correct = 0
         results = []
         
-        for text in test_cases:
-            expected = encode_g1(text)
-            prompt = f"Encode the following English text to Grade-1 Braille.\n{text}\n"
-            generated = self.generate(prompt, max_new_tokens=len(expected) + 10)
-            
+        expected_all = [encode_g1(text) for text in test_cases]
+        prompts = [f"Encode the following English text to Grade-1 Braille.\n{text}\n" for text in test_cases]
+        longest = max((len(e) for e in expected_all), default=0)
+        # Each row stops as soon as its expected Braille shows up (or at a newline)
+        generations = self.generate_batch(
+            prompts,
+            max_new_tokens=longest + 10,
+            stopping_criteria=_newline_stop(self.tokenizer),
+            stop_needles=expected_all,
+        ) if prompts else []
+        
+        for text, expected, generated in zip(test_cases, expected_all, generations):
             # Check if expected braille is in the generated output
             match = expected in generated or generated.strip() == expected
             if match:
@@ -94,11 +178,11 @@ class BrailleValidator:
         correct = 0
         results = []
         
-        for word in staples:
+        prompts = [f"Encode the following English text to Grade-2 Braille using contractions.\n{word}\n" for word in staples]
+        generations = self.generate_batch(prompts, max_new_tokens=10, stopping_criteria=_newline_stop(self.tokenizer))
+        
+        for word, generated in zip(staples, generations):
             expected = G2_STRONG[word]
-            prompt = f"Encode the following English text to Grade-2 Braille using contractions.\n{word}\n"
-            generated = self.generate(prompt, max_new_tokens=10)
-            
             match = expected in generated
             if match:
                 correct += 1
@@ -122,10 +206,10 @@ class BrailleValidator:
         correct = 0
         results = []
         
-        for braille, expected_word in test_cases:
-            prompt = f"Explain what the Braille cell {braille} represents.\n{braille}\n"
-            generated = self.generate(prompt, max_new_tokens=50)
-            
+        prompts = [f"Explain what the Braille cell {braille} represents.\n{braille}\n" for braille, _ in test_cases]
+        generations = self.generate_batch(prompts, max_new_tokens=50)
+        
+        for (braille, expected_word), generated in zip(test_cases, generations):
             match = expected_word.lower() in generated.lower()
             if match:
                 correct += 1
@@ -149,13 +233,14 @@ class BrailleValidator:
         results = []
         valid = 0
         
-        for concept, n_cells in test_cases:
-            prompt = f"Compress the following concept into exactly {n_cells} Braille cells.\n{concept}\n"
-            generated = self.generate(prompt, max_new_tokens=20)
-            
-            # Count braille cells in output
-            braille_cells = [c for c in generated if 0x2800 <= ord(c) <= 0x28FF]
-            is_valid = len(braille_cells) == n_cells
+        prompts = [f"Compress the following concept into exactly {n_cells} Braille cells.\n{concept}\n" for concept, n_cells in test_cases]
+        generations = self.generate_batch(prompts, max_new_tokens=20)
+        
+        for (concept, n_cells), generated in zip(test_cases, generations):
+            # Count braille cells in output (one vectorized pass over the code points)
+            codepoints = np.frombuffer(generated.encode("utf-32-le"), dtype=np.uint32)
+            n_braille = int(np.count_nonzero((codepoints >= 0x2800) & (codepoints <= 0x28FF)))
+            is_valid = n_braille == n_cells
             if is_valid:
                 valid += 1
             
@@ -163,7 +248,7 @@ class BrailleValidator:
                 "concept": concept,
                 "target_cells": n_cells,
                 "generated": generated[:30],
-                "actual_cells": len(braille_cells),
+                "actual_cells": n_braille,
                 "valid": is_valid
             })
         
@@ -216,17 +301,8 @@ class BrailleValidator:
         
         return results
 
-def test_braille_native(model_path: str):
+def test_braille_native(model, tokenizer):
     """Test the model's native Braille capabilities."""
-    print(f"\nLoading model from {model_path}...")
-    tokenizer = AutoTokenizer.from_pretrained(model_path)
-    model = AutoModelForCausalLM.from_pretrained(
-        model_path,
-        torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
-        device_map="auto" if torch.cuda.is_available() else None
-    )
-    model.eval()
-    
     print("\n" + "="*60)
     print("BRAILLE-NATIVE CAPABILITY TEST")
     print("="*60)
@@ -246,22 +322,11 @@ def test_braille_native(model_path: str):
     print("Braille Sequence Completion:")
     print("-" * 60)
     
-    for braille_input, description in test_cases:
-        inputs = tokenizer(braille_input, return_tensors="pt")
-        inputs = {k: v for k, v in inputs.items() if k != "token_type_ids"}
-        if torch.cuda.is_available():
-            inputs = {k: v.cuda() for k, v in inputs.items()}
-        
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=15,
-                do_sample=False,
-                pad_token_id=tokenizer.pad_token_id,
-            )
-        
-        result = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        continuation = result[len(braille_input):]
+    # All sequences in one padded batch
+    continuations = _generate_batch(model, tokenizer, [braille for braille, _ in test_cases], max_new_tokens=15)
+    
+    for (braille_input, description), continuation in zip(test_cases, continuations):
+        result = braille_input + continuation
         
         # Decode to show what it means
         decoded_input = decode_g1(braille_input)
@@ -287,14 +352,17 @@ def main():
     import sys
     model_path = sys.argv[1] if len(sys.argv) > 1 else "./braille-trained-instruct"
     
+    # Load once and share between both test suites
+    model, tokenizer = load_model(model_path)
+    
     # Run native Braille test instead of English-based probes
-    test_braille_native(model_path)
+    test_braille_native(model, tokenizer)
     
     # Also run original probes for comparison
     print("\n" + "="*60)
     print("ORIGINAL PROBE SUITE (English prompts - expected to fail)")
     print("="*60)
-    validator = BrailleValidator(model_path)
+    validator = BrailleValidator(model=model, tokenizer=tokenizer)
     results = validator.run_all_probes()
     
     # Save detailed results